@@ -7,15 +7,25 @@ from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import cv2
 import numpy as np
-import pandas as pd
 from datetime import datetime, timedelta
 import pytz
 import os
-import base64
+import binascii
 import io
 from PIL import Image
 import json
+from dataclasses import dataclass
+import math
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import time
+import sqlite3
+import tempfile
+import importlib.util
+import contextlib
 from imagekitio import ImageKit
+from cachetools import TTLCache
+import xlsxwriter
 
 # Load environment variables from .env file if available
 try:
@@ -31,6 +41,27 @@ print("Loading dependencies...done")
 
 app = Flask(__name__)
 
+# Serialize JSON responses with orjson when installed. It encodes in C and
+# handles NumPy scalars and arrays without int()/float() casts.
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+
+    class OrjsonProvider(DefaultJSONProvider):
+        """JSON provider that encodes responses with orjson"""
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            body = orjson.dumps(
+                obj, default=self.default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+            )
+            return self._app.response_class(body, mimetype=self.mimetype)
+
+    app.json = OrjsonProvider(app)
+    print("orjson available, JSON responses will use it")
+except ImportError:
+    print("orjson not installed. Using the standard library JSON encoder.")
+
 # Configure CORS for production
 allowed_origins = os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000,https://attendance-frontend-mkwg.onrender.com').split(',')
 # Clean up any whitespace
@@ -63,43 +94,255 @@ except Exception as e:
 
 print("ImageKit initialized")
 
+# libjpeg-turbo decoder for webcam snapshots (SIMD decode and native
+# downscaling while decoding). Falls back to cv2.imdecode when unavailable.
+jpeg_decoder = None
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJPF_GRAY
+    jpeg_decoder = TurboJPEG()
+    print("TurboJPEG decoder initialized")
+except ImportError:
+    print("PyTurboJPEG not installed. Using OpenCV for JPEG decoding.")
+except Exception as e:
+    print(f"TurboJPEG initialization failed: {e}. Using OpenCV for JPEG decoding.")
+
 # Configuration
 # Check if running in Docker container or locally
 if os.path.exists('/app/known_faces'):
     # Running in Docker container
     KNOWN_FACES_DIR = '/app/known_faces'
+    FACE_CACHE_DIR = '/app/face_cache'
     ATTENDANCE_FILE = '/app/attendance.xlsx'
+    ATTENDANCE_DB = '/app/data/attendance.db'
     VOICE_DIR = '/app/voice'
 else:
     # Running locally
     KNOWN_FACES_DIR = os.path.join(os.path.dirname(__file__), '..', 'projects', 'known_faces')
+    FACE_CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'projects', 'face_cache')
     ATTENDANCE_FILE = os.path.join(os.path.dirname(__file__), '..', 'attendance.xlsx')
+    ATTENDANCE_DB = os.path.join(os.path.dirname(__file__), '..', 'attendance.db')
     VOICE_DIR = os.path.join(os.path.dirname(__file__), '..', 'voice')
 
+# Preprocessed face regions and their source file metadata, so unchanged
+# images are not re-detected on every reload
+FACE_CACHE_FILE = os.path.join(FACE_CACHE_DIR, 'faces.npy')
+FACE_INDEX_FILE = os.path.join(FACE_CACHE_DIR, 'faces.json')
+RETRAIN_STATUS_FILE = os.path.join(FACE_CACHE_DIR, 'retrain_status.json')
+FACE_CACHE_LOCK_FILE = os.path.join(FACE_CACHE_DIR, 'faces.lock')
+
+# Attendance records live in SQLite. ATTENDANCE_FILE is only read once, to
+# import records from the older Excel storage into a new database.
+ATTENDANCE_DB = os.getenv('ATTENDANCE_DB', ATTENDANCE_DB)
+
 # Get port from environment variable or use default
 PORT = int(os.getenv('PORT', 5000))
 
+# Webcam frames on the recognition path are reduced by a power of two while
+# decoding, as long as their longest side stays at least this many pixels
+RECOGNITION_MAX_SIDE = int(os.getenv('RECOGNITION_MAX_SIDE', 640))
+
+# Face detection on webcam frames runs on a copy whose longest side is at most
+# this many pixels; detection cost grows with the pixel count
+DETECTION_MAX_SIDE = int(os.getenv('DETECTION_MAX_SIDE', 480))
+
+# Side length of the square face regions that are compared. Scores are
+# per-pixel averages and correlations, so the recognition threshold holds
+# for any size; 150 was the original size.
+FACE_SIZE = int(os.getenv('FACE_SIZE', 64))
+
 print("Configuration loaded")
 
+# Make sure OpenCV's SIMD code paths are in use. Its parallel backend already
+# defaults to the cores this process may run on.
+cv2.setUseOptimized(True)
+print(f"OpenCV optimized: {cv2.useOptimized()}, threads: {cv2.getNumThreads()}")
+
 # Initialize face detector
+# CascadeClassifier is not safe to share between threads, so each request
+# thread gets its own instance
+FACE_CASCADE_FILE = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+face_cascades = threading.local()
+
+def get_face_cascade():
+    """Get this thread's face cascade, loading it on first use"""
+    cascade = getattr(face_cascades, 'cascade', None)
+    if cascade is None:
+        cascade = face_cascades.cascade = cv2.CascadeClassifier(FACE_CASCADE_FILE)
+    return cascade
+
 print("Loading face cascade...")
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+get_face_cascade()
 print("Face cascade loaded successfully")
 
+# Cascade detection parameters, and more relaxed ones for difficult images
+CASCADE_PARAMS = {"scaleFactor": 1.1, "minNeighbors": 5, "minSize": (30, 30), "maxSize": (300, 300)}
+RELAXED_CASCADE_PARAMS = {"scaleFactor": 1.05, "minNeighbors": 3, "minSize": (20, 20), "maxSize": (400, 400)}
+
+# Run the cascade on the GPU when OpenCV is built with CUDA and a device is
+# present. The CUDA cascade only reads old-format cascade files, which can be
+# pointed to with CUDA_FACE_CASCADE.
+try:
+    cuda_available = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (cv2.error, AttributeError):
+    cuda_available = False
+
+cuda_cascade = None
+# Detection parameters are set on the CUDA cascade object before each call
+cuda_cascade_lock = threading.Lock()
+if cuda_available:
+    try:
+        cuda_cascade = cv2.cuda.CascadeClassifier_create(
+            os.getenv('CUDA_FACE_CASCADE', FACE_CASCADE_FILE)
+        )
+        print("CUDA face cascade loaded")
+    except cv2.error as e:
+        print(f"CUDA face cascade unavailable: {e}. Using CPU face cascade.")
+        cuda_cascade = None
+
+# Optional DNN face detector (YuNet from the OpenCV model zoo). A single forward
+# pass is much faster than the cascade's multi-scale sliding window and more
+# robust to pose, so it is used whenever the model file is available.
+FACE_DETECTOR_MODEL = os.getenv(
+    'FACE_DETECTOR_MODEL',
+    os.path.join(os.path.dirname(__file__), 'models', 'face_detection_yunet_2023mar.onnx')
+)
+
+def create_face_detector():
+    """Load the YuNet face detector, on the GPU when one is available"""
+    if cuda_available:
+        return cv2.FaceDetectorYN.create(
+            FACE_DETECTOR_MODEL, "", (320, 320), 0.6, 0.3, 5000,
+            cv2.dnn.DNN_BACKEND_CUDA, cv2.dnn.DNN_TARGET_CUDA
+        )
+    return cv2.FaceDetectorYN.create(FACE_DETECTOR_MODEL, "", (320, 320), 0.6)
+
+# The detector keeps its input size as state, so each request thread gets its
+# own instance rather than all threads queueing on a shared one
+face_detector = None
+face_detectors = threading.local()
+
+def get_face_detector():
+    """Get this thread's YuNet detector, loading it on first use"""
+    detector = getattr(face_detectors, 'detector', None)
+    if detector is None:
+        detector = face_detectors.detector = create_face_detector()
+    return detector
+
+try:
+    if os.path.exists(FACE_DETECTOR_MODEL):
+        face_detector = get_face_detector()
+        print(f"DNN face detector loaded from {FACE_DETECTOR_MODEL}")
+    else:
+        print("DNN face detector model not found. Using Haar cascade for face detection.")
+except Exception as e:
+    print(f"DNN face detector initialization failed: {e}. Using Haar cascade for face detection.")
+    face_detector = None
+
+# Filesystem events for the known faces directory, if installed
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+    print("watchdog not installed. Changes to the known faces directory made outside the API need a retrain.")
+
+# Numba JIT for the per-pixel face comparison kernel, if installed
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+    print("Numba available, face comparison kernel will be JIT compiled")
+except ImportError:
+    NUMBA_AVAILABLE = False
+    print("Numba not installed. Using OpenCV/NumPy for face comparison.")
+
 # Alternative face recognition using template matching and feature extraction
 # This approach works with standard OpenCV without the opencv-contrib extras
 print("Initializing face recognition system...")
 print("Face recognition modules loaded")
 
 # Global variables for face recognition
-known_faces = []
-known_names = []
-face_labels = []
-face_descriptors = []  # Store face feature descriptors
-is_trained = False
+@dataclass(frozen=True)
+class FaceDB:
+    """One version of the known face database, replaced as a whole on change"""
+    # Readers take face_db once and see faces, names and features from the same
+    # version without a lock
+    # Preprocessed known faces as one contiguous (N, FACE_SIZE, FACE_SIZE) uint8 array
+    faces: np.ndarray
+    names: tuple
+    files: tuple  # Source filename for each face
+    versions: tuple  # file_version() of each source file when it was processed
+    # Normalized histogram of each face, one row per face
+    hists: np.ndarray
+    # Pixel sum and sum of squares of each face, which the matcher would
+    # otherwise recompute for every face on every request
+    pixel_sums: np.ndarray
+    # Faces as centered, unit-length float32 rows, for the BLAS matcher used
+    # without Numba: template scores against all of them are one matrix-vector product
+    stack: np.ndarray
+    # Distinct names in first-seen order, so /model-status does not dedupe
+    # on every request
+    unique_names: tuple
+    
+    @property
+    def labels(self):
+        """Labels are dense positions in the database"""
+        return list(range(len(self.faces)))
+    
+    @property
+    def is_trained(self):
+        return len(self.faces) > 0
+
+def new_face_db(faces, names, files, versions, hists, pixel_sums, stack):
+    """Build a FaceDB from per-face arrays and lists"""
+    names = tuple(names)
+    return FaceDB(
+        faces=faces, names=names, files=tuple(files), versions=tuple(versions),
+        hists=hists, pixel_sums=pixel_sums, stack=stack,
+        unique_names=tuple(dict.fromkeys(names))
+    )
+
+face_db = new_face_db(
+    np.empty((0, FACE_SIZE, FACE_SIZE), np.uint8), (), (), (),
+    np.empty((0, 256), np.float32), np.empty((0, 2), np.int64),
+    np.empty((0, FACE_SIZE * FACE_SIZE), np.float32)
+)
+skipped_files = {}  # Images with no detectable face, filename -> file_version()
+
+# Serializes changes to the face database (API requests and filesystem events)
+face_db_lock = threading.RLock()
 
-# Store last attendance time for cooldown
-last_attendance = {}
+# Full retrains run here, one at a time, so the request that starts one returns
+# immediately. retrain_job is this process's latest (job id, Future).
+retrain_executor = ThreadPoolExecutor(max_workers=1)
+retrain_job = (None, None)
+retrain_job_lock = threading.Lock()
+
+# ImageKit uploads run in the background so add-person does not wait on the
+# network; the local copy is what recognition uses. upload_status maps each
+# uploaded filename to "pending" and then its CDN URL or "Local storage only".
+upload_executor = ThreadPoolExecutor(max_workers=4)
+upload_status = {}
+
+# Face images in KNOWN_FACES_DIR, filename -> (name, st_ctime), so listing
+# endpoints answer from memory instead of scanning the directory. name_to_file
+# maps each person's name back to their image for /delete-person.
+known_index = {}
+name_to_file = {}
+known_index_lock = threading.Lock()
+
+# Cooldown between attendance marks for the same person, in seconds
+ATTENDANCE_COOLDOWN = 60
+
+# time.monotonic() of each person's last mark seen by this process. Entries
+# expire once the cooldown has passed, so the cache only holds people seen in
+# the last minute. The attendance database is the authority across processes.
+last_attendance = TTLCache(maxsize=10_000, ttl=ATTENDANCE_COOLDOWN, timer=time.monotonic)
+last_attendance_lock = threading.Lock()
+
+# Shared connection to the attendance database, opened on first use
+attendance_db = None
+attendance_lock = threading.Lock()
 
 def extract_face_features(face_region):
     """Extract features from a face region using ORB detector"""
@@ -109,60 +352,132 @@ def extract_face_features(face_region):
 
 def compute_face_histogram(face_region):
     """Compute histogram features for face comparison"""
-    # Convert to different color spaces and compute histograms
-    hist_gray = cv2.calcHist([face_region], [0], None, [256], [0, 256])
+    # Count the gray levels directly; for face-sized uint8 images this is
+    # cheaper than a cv2.calcHist + cv2.normalize round trip
+    hist_gray = np.bincount(face_region.ravel(), minlength=256).astype(np.float32)
     
-    # Normalize histogram
-    hist_gray = cv2.normalize(hist_gray, hist_gray).flatten()
+    # Normalize histogram to pixel frequencies. Correlation scores do not
+    # depend on the scale, so this matches the previous L2 normalization.
+    hist_gray /= face_region.size
     
     return hist_gray
 
-def compare_faces(face1, face2):
-    """Compare two faces using multiple similarity metrics"""
-    # Method 1: Template matching
-    result = cv2.matchTemplate(face1, face2, cv2.TM_CCOEFF_NORMED)
-    template_score = np.max(result)
-    
-    # Method 2: Histogram comparison
-    hist1 = compute_face_histogram(face1)
-    hist2 = compute_face_histogram(face2)
-    hist_score = cv2.compareHist(hist1, hist2, cv2.HISTCMP_CORREL)
-    
-    # Method 3: Simple pixel difference (alternative to SSIM)
-    # Normalize images to same size if needed
-    if face1.shape != face2.shape:
-        face2 = cv2.resize(face2, (face1.shape[1], face1.shape[0]))
+def normalized_histogram(face_region):
+    """Compute a face histogram whose dot products are HISTCMP_CORREL scores"""
+    hist = compute_face_histogram(face_region)
+    hist = hist - hist.mean()
+    norm = np.linalg.norm(hist)
+    return hist / norm if norm > 0 else hist
+
+def build_hist_matrix(faces):
+    """Stack the normalized histograms of a list or array of faces"""
+    if len(faces) == 0:
+        return np.empty((0, 256), np.float32)
+    return np.stack([normalized_histogram(face) for face in faces]).astype(np.float32)
+
+def build_pixel_sums(faces):
+    """Get the pixel sum and sum of squares of each face in an array of faces"""
+    flat = faces.reshape(len(faces), -1)
+    return np.stack([
+        flat.sum(axis=1, dtype=np.int64),
+        np.einsum('ij,ij->i', flat, flat, dtype=np.int64)
+    ], axis=1)
+
+def centered_unit_rows(flat):
+    """Subtract each row's mean and scale it to unit length (all-zero if constant)"""
+    flat = flat - flat.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(flat, axis=1, keepdims=True)
+    return np.divide(flat, norms, out=np.zeros_like(flat), where=norms > 0)
+
+def build_face_stack(faces):
+    """Flatten faces into centered, unit-length float32 rows for template scores"""
+    return centered_unit_rows(faces.reshape(len(faces), -1).astype(np.float32))
+
+def gallery_pixel_scores_blas(query, stack, gallery_sums):
+    """Template scores and MSEs of a face against every known face, without Numba"""
+    a = query.ravel()
+    n = a.size
+    sum_a = int(a.sum(dtype=np.int64))
+    sum_aa = int(np.square(a, dtype=np.int64).sum())
+    query_row = centered_unit_rows(a.astype(np.float32)[np.newaxis])[0]
+    template_scores = (stack @ query_row).astype(np.float64)
     
-    # Calculate mean squared error
-    mse = np.mean((face1.astype(np.float32) - face2.astype(np.float32)) ** 2)
-    # Convert MSE to similarity score (lower MSE = higher similarity)
-    mse_score = max(0, 1 - (mse / 10000))  # Normalize MSE to 0-1 range
+    # Recover the raw cross terms: cov = score * |a - mean(a)| * |b - mean(b)|
+    sum_b = gallery_sums[:, 0]
+    sum_bb = gallery_sums[:, 1]
+    var_a = sum_aa - sum_a * sum_a / n
+    var_b = sum_bb - sum_b * sum_b / n
+    sum_ab = template_scores * np.sqrt(var_a * var_b) + sum_a * sum_b / n
+    mses = (sum_aa + sum_bb - 2 * sum_ab) / n
+    return template_scores, mses
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def combine_score(template_score, hist_score, mse):
+        """Weighted score of one face: 0.5 template + 0.3 histogram + 0.2 MSE similarity"""
+        mse_score = max(0.0, 1 - mse / 10000)
+        return template_score * 0.5 + hist_score * 0.3 + mse_score * 0.2
     
-    # Combine scores (weighted average)
-    combined_score = (template_score * 0.5 + hist_score * 0.3 + mse_score * 0.2)
+    @njit(cache=True)
+    def gallery_match_scores(query, gallery, gallery_sums, hist_scores):
+        """Combined template, histogram and MSE scores of a face against every known face"""
+        # Template score and MSE both follow from the pixel sums, sums of squares
+        # and the cross term, so each known face costs one multiply-add per pixel
+        a = query.ravel()
+        n = a.size
+        sum_a = sum_aa = 0
+        for i in range(n):
+            x = np.int64(a[i])
+            sum_a += x
+            sum_aa += x * x
+        var_a = sum_aa - sum_a * sum_a / n
+        
+        count = gallery.shape[0]
+        g = gallery.reshape(count, n)
+        scores = np.empty(count)
+        for j in range(count):
+            sum_ab = 0
+            for i in range(n):
+                sum_ab += np.int64(a[i]) * np.int64(g[j, i])
+            
+            sum_b = gallery_sums[j, 0]
+            sum_bb = gallery_sums[j, 1]
+            cov = sum_ab - sum_a * sum_b / n
+            var_b = sum_bb - sum_b * sum_b / n
+            template_score = cov / math.sqrt(var_a * var_b) if var_a > 0 and var_b > 0 else 0.0
+            mse = (sum_aa + sum_bb - 2 * sum_ab) / n
+            scores[j] = combine_score(template_score, hist_scores[j], mse)
+        return scores
     
-    return combined_score
+    # Compile (or load from the on-disk cache) at startup rather than on the first request
+    _warmup = np.zeros((1, FACE_SIZE, FACE_SIZE), np.uint8)
+    gallery_match_scores(_warmup[0], _warmup, build_pixel_sums(_warmup), np.zeros(1, np.float32))
 
-def find_best_match(face_region):
-    """Find the best matching face from known faces"""
-    if len(known_faces) == 0:
+def combine_scores(template_scores, hist_scores, mses):
+    """Weighted scores from per-face metrics: 0.5 template + 0.3 histogram + 0.2 MSE similarity"""
+    mse_scores = np.maximum(0, 1 - mses / 10000)
+    return template_scores * 0.5 + hist_scores * 0.3 + mse_scores * 0.2
+
+def find_best_match(face_region, db):
+    """Find the best matching face in a FaceDB"""
+    if len(db.faces) == 0:
         return None, 0.0
     
-    best_score = 0.0
-    best_match_idx = -1
+    # Histogram correlation against every known face in one matrix-vector product
+    hist_scores = db.hists @ normalized_histogram(face_region)
     
-    for i, known_face in enumerate(known_faces):
-        try:
-            score = compare_faces(face_region, known_face)
-            if score > best_score:
-                best_score = score
-                best_match_idx = i
-        except Exception as e:
-            print(f"Error comparing with face {i}: {e}")
-            continue
+    # Scores for the whole gallery at once, from one pass of the JIT kernel
+    # or one matrix-vector product
+    if NUMBA_AVAILABLE:
+        scores = gallery_match_scores(face_region, db.faces, db.pixel_sums, hist_scores)
+    else:
+        template_scores, mses = gallery_pixel_scores_blas(face_region, db.stack, db.pixel_sums)
+        scores = combine_scores(template_scores, hist_scores, mses)
+    best = int(np.argmax(scores))
+    best_score = max(float(scores[best]), 0.0)
     
-    if best_match_idx >= 0 and best_score > 0.6:  # Threshold for recognition
-        return best_match_idx, best_score
+    if best_score > 0.6:  # Threshold for recognition
+        return best, best_score
     
     return None, best_score
 
@@ -171,127 +486,544 @@ def get_indian_time():
     ist = pytz.timezone('Asia/Kolkata')
     return datetime.now(ist)
 
-def load_known_faces():
-    """Load and train the face recognizer with known faces"""
-    global known_faces, known_names, face_labels, is_trained
+def detect_faces(image, gray, relaxed=False):
+    """Detect faces in an image and return their (x, y, w, h) boxes"""
+    if face_detector is not None:
+        height, width = image.shape[:2]
+        detector = get_face_detector()
+        detector.setInputSize((width, height))
+        _, faces = detector.detect(image)
+        if faces is None:
+            return []
+        return [tuple(int(v) for v in face[:4]) for face in faces]
+    
+    params = RELAXED_CASCADE_PARAMS if relaxed else CASCADE_PARAMS
+    
+    if cuda_cascade is not None:
+        return detect_faces_cuda(gray, params)
+    
+    return get_face_cascade().detectMultiScale(gray, **params)
+
+def detect_faces_cuda(gray, params):
+    """Run the face cascade on the GPU"""
+    gpu_gray = cv2.cuda_GpuMat()
+    gpu_gray.upload(gray)
+    
+    with cuda_cascade_lock:
+        cuda_cascade.setScaleFactor(params["scaleFactor"])
+        cuda_cascade.setMinNeighbors(params["minNeighbors"])
+        cuda_cascade.setMinObjectSize(params["minSize"])
+        cuda_cascade.setMaxObjectSize(params["maxSize"])
+        objects = cuda_cascade.detectMultiScale(gpu_gray)
+        faces = cuda_cascade.convert(objects)
+    
+    return faces if faces is not None else []
+
+def detect_faces_downscaled(image, gray, max_side, retry_relaxed=False):
+    """Detect faces on a reduced copy of the image, returning full resolution boxes"""
+    # Also keeps close-up faces within the cascade's maxSize. With retry_relaxed
+    # the relaxed parameters are tried on the same reduced image.
+    height, width = gray.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    if scale < 1:
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        # Only the DNN detector looks at the color image
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA) if face_detector is not None else None
+    
+    faces = detect_faces(image, gray)
+    # The relaxed retry only helps the cascade; the DNN detector has no equivalent
+    if retry_relaxed and len(faces) == 0 and face_detector is None:
+        faces = detect_faces(image, gray, relaxed=True)
+        if len(faces) > 0:
+            print("Face detected with relaxed parameters")
     
-    known_faces = []
-    known_names = []
-    face_labels = []
+    if scale == 1:
+        return faces
+    return [tuple(int(round(v / scale)) for v in face) for face in faces]
+
+def is_face_image(filename):
+    """Check whether a file in the known faces directory is a face image"""
+    return filename.endswith('.jpg') or filename.endswith('.png')
+
+# Per-thread scratch buffers for the recognition path, so handling a frame does
+# not allocate fresh intermediate images on every request
+_scratch = threading.local()
+
+def get_scratch(name, shape):
+    """Get a preallocated uint8 buffer of the given shape, private to this thread"""
+    buf = getattr(_scratch, name, None)
+    if buf is None or buf.shape != shape:
+        buf = np.empty(shape, np.uint8)
+        setattr(_scratch, name, buf)
+    return buf
+
+def preprocess_face(gray, face, out=None):
+    """Crop, resize and normalize a detected face region, into out if given"""
+    x, y, w, h = face
+    
+    # Add some padding around the face
+    padding = 10
+    x = max(0, x - padding)
+    y = max(0, y - padding)
+    w = min(gray.shape[1] - x, w + 2 * padding)
+    h = min(gray.shape[0] - y, h + 2 * padding)
+    
+    # Standardize face size for better recognition
+    resized = get_scratch('resized', (FACE_SIZE, FACE_SIZE))
+    cv2.resize(gray[y:y+h, x:x+w], (FACE_SIZE, FACE_SIZE), dst=resized, interpolation=cv2.INTER_AREA)
+    
+    # Apply histogram equalization for better lighting normalization
+    cv2.equalizeHist(resized, dst=resized)
+    # Apply Gaussian blur to reduce noise
+    if out is None:
+        out = np.empty((FACE_SIZE, FACE_SIZE), np.uint8)
+    cv2.GaussianBlur(resized, (3, 3), 0, dst=out)
+    
+    return out
+
+def process_face_file(filename):
+    """Detect and preprocess the face in a known face image file"""
+    image_path = os.path.join(KNOWN_FACES_DIR, filename)
+    image = cv2.imread(image_path)
+    
+    if image is None:
+        return None
+    
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    faces = detect_faces_downscaled(image, gray, DETECTION_MAX_SIDE, retry_relaxed=True)
+    
+    if len(faces) == 0:
+        print(f"No face detected in {filename}. Skipping...")
+        return None
+    
+    # Take the largest face (most likely the main subject)
+    largest_face = max(faces, key=lambda face: face[2] * face[3])
+    return preprocess_face(gray, largest_face)
+
+def file_version(stat):
+    """Identify the version of a file from its stat result"""
+    # A list rather than a tuple so it compares equal after a JSON round trip
+    return [stat.st_mtime_ns, stat.st_size]
+
+def face_cache_settings():
+    """Settings that affect the cached face regions and skipped files"""
+    detector = "yunet" if face_detector is not None else ("cuda" if cuda_cascade is not None else "cascade")
+    return {"face_size": FACE_SIZE, "detection_max_side": DETECTION_MAX_SIDE, "detector": detector}
+
+# File locks keep worker processes from mixing one worker's faces.npy with
+# another's faces.json. Not available on Windows, where only the single
+# process development server is used.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+@contextlib.contextmanager
+def face_cache_file_lock(shared=False):
+    """Hold the face cache lock across processes while reading or writing the cache"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(FACE_CACHE_DIR, exist_ok=True)
+    with open(FACE_CACHE_LOCK_FILE, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+
+def load_state():
+    """Load the cached faces, {filename: (version, row)} and the skipped files"""
+    # The faces are memory-mapped copy-on-write, so worker processes share the
+    # pages of the cache file instead of each reading a copy
+    empty = np.empty((0, FACE_SIZE, FACE_SIZE), np.uint8)
+    try:
+        if not (os.path.exists(FACE_CACHE_FILE) and os.path.exists(FACE_INDEX_FILE)):
+            return empty, {}, {}
+        
+        # Read both files under the lock so they come from the same save
+        with face_cache_file_lock(shared=True):
+            with open(FACE_INDEX_FILE) as f:
+                index = json.load(f)
+            faces = np.load(FACE_CACHE_FILE, mmap_mode='c')
+        
+        # Faces cached with other settings must be reprocessed, and images
+        # skipped before may have a detectable face now
+        if index.get('settings') != face_cache_settings():
+            print("Face processing settings changed, rebuilding face cache")
+            return empty, {}, {}
+        
+        if len(faces) != len(index['faces']):
+            raise ValueError("face cache and index are out of sync")
+        
+        cache = {
+            entry['filename']: (entry.get('version'), i)
+            for i, entry in enumerate(index['faces'])
+        }
+        return faces, cache, index['skipped']
+    except Exception as e:
+        print(f"Could not read face cache, rebuilding: {e}")
+        return empty, {}, {}
+
+def save_state():
+    """Persist the current face regions so unchanged images are not reprocessed"""
+    try:
+        os.makedirs(FACE_CACHE_DIR, exist_ok=True)
+        
+        db = face_db
+        index = {
+            "faces": [
+                {"filename": filename, "version": version, "name": name, "label": label}
+                for label, (filename, version, name) in enumerate(zip(db.files, db.versions, db.names))
+            ],
+            "skipped": skipped_files,
+            "settings": face_cache_settings()
+        }
+        faces = db.faces
+        
+        # Write to temporary files first so a crash never leaves a half-written
+        # cache. Replacing the file leaves a memory-mapped older version intact.
+        # The temporary names are per process since every worker keeps the cache.
+        suffix = f'.{os.getpid()}.tmp'
+        with open(FACE_CACHE_FILE + suffix, 'wb') as f:
+            np.save(f, faces)
+        with open(FACE_INDEX_FILE + suffix, 'w') as f:
+            json.dump(index, f)
+        # Both files are replaced under the lock so they always come from the
+        # same worker's save
+        with face_cache_file_lock():
+            os.replace(FACE_CACHE_FILE + suffix, FACE_CACHE_FILE)
+            os.replace(FACE_INDEX_FILE + suffix, FACE_INDEX_FILE)
+    except Exception as e:
+        print(f"Error saving face cache: {e}")
+
+def load_known_faces():
+    """Load the known faces, only reprocessing images that changed since the last load"""
+    global face_db, skipped_files
     
     if not os.path.exists(KNOWN_FACES_DIR):
         os.makedirs(KNOWN_FACES_DIR, exist_ok=True)
+        faces = np.empty((0, FACE_SIZE, FACE_SIZE), np.uint8)
+        face_db = new_face_db(faces, (), (), (), build_hist_matrix(faces), build_pixel_sums(faces), build_face_stack(faces))
+        skipped_files = {}
         return False
     
-    label_counter = 0
-    for filename in os.listdir(KNOWN_FACES_DIR):
-        if filename.endswith('.jpg') or filename.endswith('.png'):
-            image_path = os.path.join(KNOWN_FACES_DIR, filename)
-            image = cv2.imread(image_path)
+    cached_faces, cache, skipped = load_state()
+    new_faces, new_names, new_files, new_versions = [], [], [], []
+    cached_rows = []
+    new_skipped = {}
+    new_index = {}
+    reprocessed = 0
+    reused = 0
+    
+    # Decide per file whether to reuse the cache, skip it or process it
+    plan = []
+    with os.scandir(KNOWN_FACES_DIR) as entries:
+        for entry in entries:
+            if not is_face_image(entry.name):
+                continue
             
-            if image is not None:
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                # Improved face detection parameters
-                faces = face_cascade.detectMultiScale(
-                    gray, 
-                    scaleFactor=1.1, 
-                    minNeighbors=5, 
-                    minSize=(30, 30),
-                    maxSize=(300, 300)
-                )
-                
-                if len(faces) > 0:
-                    # Take the largest face (most likely the main subject)
-                    largest_face = max(faces, key=lambda face: face[2] * face[3])
-                    x, y, w, h = largest_face
-                    
-                    # Add some padding around the face
-                    padding = 10
-                    x = max(0, x - padding)
-                    y = max(0, y - padding)
-                    w = min(gray.shape[1] - x, w + 2 * padding)
-                    h = min(gray.shape[0] - y, h + 2 * padding)
-                    
-                    face_region = gray[y:y+h, x:x+w]
-                    # Standardize face size for better recognition
-                    face_region = cv2.resize(face_region, (150, 150))
-                    
-                    # Apply histogram equalization for better lighting normalization
-                    face_region = cv2.equalizeHist(face_region)
-                    # Apply Gaussian blur to reduce noise
-                    face_region = cv2.GaussianBlur(face_region, (3, 3), 0)
-                    
-                    known_faces.append(face_region)
-                    name = filename.split('.')[0]
-                    known_names.append(name)
-                    face_labels.append(label_counter)
-                    
-                    print(f"Loaded face for: {name} (Label: {label_counter})")
-                    label_counter += 1
-                else:
-                    print(f"No face detected in {filename}. Trying with different parameters...")
-                    # Try with more relaxed parameters for difficult images
-                    faces_relaxed = face_cascade.detectMultiScale(
-                        gray, 
-                        scaleFactor=1.05, 
-                        minNeighbors=3, 
-                        minSize=(20, 20),
-                        maxSize=(400, 400)
-                    )
-                    
-                    if len(faces_relaxed) > 0:
-                        print(f"Face detected with relaxed parameters for {filename}")
-                        largest_face = max(faces_relaxed, key=lambda face: face[2] * face[3])
-                        x, y, w, h = largest_face
-                        
-                        # Add some padding around the face
-                        padding = 10
-                        x = max(0, x - padding)
-                        y = max(0, y - padding)
-                        w = min(gray.shape[1] - x, w + 2 * padding)
-                        h = min(gray.shape[0] - y, h + 2 * padding)
-                        
-                        face_region = gray[y:y+h, x:x+w]
-                        face_region = cv2.resize(face_region, (150, 150))
-                        face_region = cv2.equalizeHist(face_region)
-                        face_region = cv2.GaussianBlur(face_region, (3, 3), 0)
-                        
-                        known_faces.append(face_region)
-                        name = filename.split('.')[0]
-                        known_names.append(name)
-                        face_labels.append(label_counter)
-                        
-                        print(f"Loaded face for: {name} (Label: {label_counter}) with relaxed detection")
-                        label_counter += 1
-                    else:
-                        print(f"Still no face detected in {filename}. Skipping...")
-    
-    if len(known_faces) > 0:
-        print(f"Face database loaded with {len(known_faces)} faces...")
-        is_trained = True
-        print(f"Training completed. Names: {known_names}")
-        print(f"Labels: {face_labels}")
+            stat = entry.stat()
+            version = file_version(stat)
+            new_index[entry.name] = (entry.name.split('.')[0], stat.st_ctime)
+            cached = cache.get(entry.name)
+            
+            if cached is not None and cached[0] == version:
+                plan.append((entry.name, version, cached[1]))
+            elif skipped.get(entry.name) == version:
+                # Already known to contain no detectable face
+                new_skipped[entry.name] = version
+            else:
+                plan.append((entry.name, version, None))
+    
+    # Decoding and detection release the GIL, so changed images are processed
+    # on a thread pool. Each thread has its own cascade or YuNet detector and
+    # its own scratch buffers.
+    to_process = [filename for filename, _, row in plan if row is None]
+    processed = {}
+    if to_process:
+        # Cores this process may run on, which can be fewer than the host has
+        cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=min(len(to_process), cpus)) as pool:
+            processed = dict(zip(to_process, pool.map(process_face_file, to_process)))
+    
+    for filename, version, row in plan:
+        if row is not None:
+            face_region = cached_faces[row]
+            cached_rows.append(row)
+            reused += 1
+        else:
+            face_region = processed[filename]
+            reprocessed += 1
+            if face_region is None:
+                new_skipped[filename] = version
+                continue
+        
+        name = filename.split('.')[0]
+        new_faces.append(face_region)
+        new_names.append(name)
+        new_files.append(filename)
+        new_versions.append(version)
+        print(f"Loaded face for: {name} (Label: {len(new_faces) - 1})")
+    
+    # When every face came from the cache in its original order, use the
+    # memory-mapped cache as is. Otherwise copy the faces into a single
+    # contiguous array once, instead of keeping a list of separate arrays.
+    if new_faces and cached_rows == list(range(len(cached_faces))) and reprocessed == 0:
+        new_faces = cached_faces
+    else:
+        new_faces = np.stack(new_faces) if new_faces else np.empty((0, FACE_SIZE, FACE_SIZE), np.uint8)
+    db = face_db = new_face_db(
+        new_faces, new_names, new_files, new_versions,
+        build_hist_matrix(new_faces), build_pixel_sums(new_faces), build_face_stack(new_faces)
+    )
+    skipped_files = new_skipped
+    
+    with known_index_lock:
+        known_index.clear()
+        known_index.update(new_index)
+        name_to_file.clear()
+        name_to_file.update((name, filename) for filename, (name, _) in new_index.items())
+    
+    # Only rewrite the cache when something was added, changed or removed
+    if reprocessed > 0 or len(cache) != len(db.files) or skipped != skipped_files:
+        save_state()
+    
+    print(f"Reprocessed {reprocessed} image(s), reused {reused} from cache")
+    
+    if db.is_trained:
+        print(f"Face database loaded with {len(db.faces)} faces...")
+        print(f"Training completed. Names: {list(db.names)}")
+        print(f"Labels: {db.labels}")
         return True
     
     print("No faces found for training")
     return False
 
-def base64_to_cv2(base64_str):
-    """Convert base64 string to OpenCV image"""
+def add_known_face(filename, face_region=None):
+    """Process a single new or replaced face image and add it to the database"""
+    global face_db
+    
+    stat = os.stat(os.path.join(KNOWN_FACES_DIR, filename))
+    name = filename.split('.')[0]
+    with known_index_lock:
+        known_index[filename] = (name, stat.st_ctime)
+        name_to_file[name] = filename
+    
+    if face_region is None:
+        face_region = process_face_file(filename)
+    if face_region is None:
+        # Drop any previous face for this file and remember it has none
+        remove_known_face(filename)
+        skipped_files[filename] = file_version(stat)
+        save_state()
+        return False
+    
+    version = file_version(stat)
+    skipped_files.pop(filename, None)
+    
+    # Build the new version alongside the current one, which readers may be using
+    db = face_db
+    if filename in db.files:
+        # Replacing an existing person's image keeps their label
+        idx = db.files.index(filename)
+        faces = db.faces.copy()
+        faces[idx] = face_region
+        versions = list(db.versions)
+        versions[idx] = version
+        hists = db.hists.copy()
+        hists[idx] = normalized_histogram(face_region)
+        pixel_sums = db.pixel_sums.copy()
+        pixel_sums[idx] = build_pixel_sums(face_region[np.newaxis])[0]
+        stack = db.stack.copy()
+        stack[idx] = build_face_stack(face_region[np.newaxis])[0]
+        names, files = db.names, db.files
+    else:
+        idx = len(db.faces)
+        faces = np.concatenate([db.faces, face_region[np.newaxis]])
+        names = db.names + (name,)
+        files = db.files + (filename,)
+        versions = db.versions + (version,)
+        hists = np.vstack([db.hists, normalized_histogram(face_region)])
+        pixel_sums = np.vstack([db.pixel_sums, build_pixel_sums(face_region[np.newaxis])])
+        stack = np.vstack([db.stack, build_face_stack(face_region[np.newaxis])])
+    
+    face_db = new_face_db(faces, names, files, versions, hists, pixel_sums, stack)
+    
+    save_state()
+    print(f"Loaded face for: {name} (Label: {idx})")
+    return True
+
+def remove_known_face(filename):
+    """Drop a single face image from the database"""
+    global face_db
+    
+    if not os.path.exists(os.path.join(KNOWN_FACES_DIR, filename)):
+        with known_index_lock:
+            entry = known_index.pop(filename, None)
+            if entry is not None and name_to_file.get(entry[0]) == filename:
+                # Fall back to another image with the same name, if any
+                others = [other for other, (name, _) in known_index.items() if name == entry[0]]
+                if others:
+                    name_to_file[entry[0]] = others[0]
+                else:
+                    del name_to_file[entry[0]]
+    
+    if filename in skipped_files:
+        del skipped_files[filename]
+        save_state()
+    
+    db = face_db
+    if filename not in db.files:
+        return False
+    
+    # Labels are positions in the database, so they stay dense
+    idx = db.files.index(filename)
+    face_db = new_face_db(
+        np.delete(db.faces, idx, axis=0),
+        db.names[:idx] + db.names[idx + 1:],
+        db.files[:idx] + db.files[idx + 1:],
+        db.versions[:idx] + db.versions[idx + 1:],
+        np.delete(db.hists, idx, axis=0),
+        np.delete(db.pixel_sums, idx, axis=0),
+        np.delete(db.stack, idx, axis=0)
+    )
+    save_state()
+    return True
+
+def sync_known_face(filename):
+    """Bring the face database in line with a face image file's current state"""
+    with face_db_lock:
+        path = os.path.join(KNOWN_FACES_DIR, filename)
+        if not os.path.exists(path):
+            remove_known_face(filename)
+            return
+        
+        # Skip files whose current version has already been processed
+        version = file_version(os.stat(path))
+        db = face_db
+        if filename in db.files and db.versions[db.files.index(filename)] == version:
+            return
+        if skipped_files.get(filename) == version:
+            return
+        
+        add_known_face(filename)
+
+if WATCHDOG_AVAILABLE:
+    class KnownFacesEventHandler(FileSystemEventHandler):
+        """Apply face images added, replaced or removed outside the API"""
+        
+        def on_any_event(self, event):
+            if event.is_directory or event.event_type not in ('created', 'modified', 'deleted', 'moved', 'closed'):
+                return
+            
+            paths = [event.src_path]
+            if event.event_type == 'moved':
+                paths.append(event.dest_path)
+            
+            for path in paths:
+                filename = os.path.basename(path)
+                if is_face_image(filename):
+                    try:
+                        sync_known_face(filename)
+                    except Exception as e:
+                        print(f"Error syncing {filename}: {e}")
+
+def start_known_faces_watcher():
+    """Watch KNOWN_FACES_DIR so outside changes reach the index and database"""
+    if not WATCHDOG_AVAILABLE:
+        return None
+    
     try:
-        # Remove data URL prefix if present
-        if 'data:image' in base64_str:
-            base64_str = base64_str.split(',')[1]
+        os.makedirs(KNOWN_FACES_DIR, exist_ok=True)
+        observer = Observer()
+        observer.daemon = True
+        observer.schedule(KnownFacesEventHandler(), KNOWN_FACES_DIR, recursive=False)
+        observer.start()
+        print(f"Watching {KNOWN_FACES_DIR} for changes")
+        return observer
+    except Exception as e:
+        print(f"Could not watch known faces directory: {e}")
+        return None
+
+def list_known_face_files():
+    """Get the face image filenames in KNOWN_FACES_DIR"""
+    with known_index_lock:
+        return list(known_index)
+
+def decode_jpeg_turbo(img_data, max_side=None, grayscale=False):
+    """Decode JPEG bytes with TurboJPEG, optionally downscaling or luma only"""
+    scaling_factor = None
+    if max_side:
+        width, height = jpeg_decoder.decode_header(img_data)[:2]
+        # Largest libjpeg reduction that keeps the image at least max_side wide
+        for denom in (8, 4, 2):
+            if max(width, height) // denom >= max_side:
+                scaling_factor = (1, denom)
+                break
+    if grayscale:
+        img = jpeg_decoder.decode(img_data, pixel_format=TJPF_GRAY, scaling_factor=scaling_factor)
+        return img.reshape(img.shape[:2])
+    return jpeg_decoder.decode(img_data, pixel_format=TJPF_BGR, scaling_factor=scaling_factor)
+
+def bytes_to_cv2(img_data, max_side=None, grayscale=False):
+    """Convert encoded image bytes to OpenCV image"""
+    try:
+        # JPEG payloads start with the SOI marker
+        if jpeg_decoder is not None and img_data[:2] == b'\xff\xd8':
+            try:
+                return decode_jpeg_turbo(img_data, max_side, grayscale)
+            except Exception as e:
+                print(f"TurboJPEG decode failed, falling back to OpenCV: {e}")
         
-        # Decode base64
-        img_data = base64.b64decode(base64_str)
+        # np.frombuffer wraps the bytes without copying them
         img_array = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        # IMREAD_GRAYSCALE lets libjpeg decode only the luma channel
+        img = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
         return img
+    except Exception as e:
+        print(f"Error decoding image: {e}")
+        return None
+
+def base64_to_cv2(base64_str, max_side=None, grayscale=False):
+    """Convert base64 string (or ASCII bytes) to OpenCV image"""
+    try:
+        # a2b_base64 reads the memoryview below in place, where b64decode
+        # would copy it to bytes first
+        if isinstance(base64_str, str):
+            base64_str = base64_str.encode('ascii')
+        
+        # Remove data URL prefix if present. The prefix is short, so only its
+        # first bytes are searched rather than the whole payload.
+        comma = base64_str.find(b',', 0, 64)
+        if comma >= 0:
+            base64_str = memoryview(base64_str)[comma + 1:]
+        
+        # Decode base64
+        img_data = binascii.a2b_base64(base64_str)
+        return bytes_to_cv2(img_data, max_side, grayscale)
     except Exception as e:
         print(f"Error converting base64 to CV2: {e}")
         return None
 
+def get_request_image_payload():
+    """Get the form fields and image payload of an add-person/mark-attendance request"""
+    # Raw image bodies (octet-stream or image/*) and multipart uploads are
+    # passed on as bytes; JSON bodies carry a base64 (data URL) "image" field
+    if request.mimetype == 'application/octet-stream' or request.mimetype.startswith('image/'):
+        return request.args, request.get_data()
+    
+    upload = request.files.get('image')
+    if upload is not None:
+        return request.form, upload.read()
+    
+    data = request.get_json(silent=True) or {}
+    return data, data.get('image')
+
+def payload_to_cv2(image_data, max_side=None, grayscale=False):
+    """Convert an image payload from get_request_image_payload to OpenCV image"""
+    if isinstance(image_data, bytes):
+        return bytes_to_cv2(image_data, max_side, grayscale)
+    return base64_to_cv2(image_data, max_side, grayscale)
+
 def upload_image_to_imagekit(image, filename):
     """Upload image to ImageKit and return the CDN URL"""
     if not imagekit:
@@ -352,38 +1084,186 @@ def upload_image_to_imagekit(image, filename):
         print("Falling back to local storage only...")
         return "local_storage_fallback"
 
-def save_attendance(name, confidence):
-    """Save attendance record to Excel file"""
+def finish_imagekit_upload(filename, future):
+    """Record the outcome of a background ImageKit upload"""
+    try:
+        url = future.result()
+    except Exception as e:
+        print(f"Error uploading {filename} to ImageKit: {e}")
+        url = None
+    
+    if not url or url == "local_storage_fallback":
+        print(f"ImageKit upload of {filename} failed, keeping local storage only")
+        url = "Local storage only"
+    else:
+        print(f"Image uploaded to ImageKit: {url}")
+    upload_status[filename] = url
+
+def import_attendance_file(conn):
+    """Copy records from the legacy Excel attendance file into the database"""
+    if not os.path.exists(ATTENDANCE_FILE):
+        return
+    
+    # pandas is only needed for this one-time import, so it is not loaded at
+    # startup or kept in memory by every worker
+    import pandas as pd
+    
+    # Only parse the columns that are stored. The Rust calamine reader is much
+    # faster than openpyxl, which is kept as the fallback.
+    engine = 'calamine' if importlib.util.find_spec('python_calamine') else 'openpyxl'
+    df = pd.read_excel(
+        ATTENDANCE_FILE, engine=engine,
+        usecols=lambda column: column in ('Name', 'Date', 'Time', 'Confidence')
+    )
+    # Rows without a name, date or time cannot be stored
+    df = df.dropna(subset=['Name', 'Date', 'Time'])
+    if df.empty:
+        return
+    
+    # Excel may hand back dates and times as strings in various formats,
+    # timestamps or time objects, so store them in the same text format new
+    # records use. Day-first dates (02/01/2025) are the local convention.
+    from datetime import time as time_of_day
+    time_text = df['Time'].map(
+        lambda value: value.strftime('%H:%M:%S') if isinstance(value, (datetime, time_of_day)) else str(value).strip()
+    )
+    dates = pd.to_datetime(df['Date'], format='mixed', dayfirst=True, errors='coerce').dt.strftime('%Y-%m-%d')
+    times = pd.to_datetime('2000-01-01 ' + time_text, format='mixed', errors='coerce').dt.strftime('%H:%M:%S')
+    
+    # Skip rows whose date or time cannot be parsed rather than failing the import
+    parsed = dates.notna() & times.notna()
+    if not parsed.all():
+        print(f"Skipping {int((~parsed).sum())} attendance record(s) with an unreadable date or time")
+        df, dates, times = df[parsed], dates[parsed], times[parsed]
+        if df.empty:
+            return
+    
+    stamps = pd.to_datetime(dates + ' ' + times).dt.tz_localize('Asia/Kolkata')
+    ts = stamps.astype('int64') // 10**9
+    confidence = df['Confidence'] if 'Confidence' in df.columns else [None] * len(df)
+    
+    conn.executemany(
+        "INSERT INTO attendance (name, date, time, confidence, ts) VALUES (?, ?, ?, ?, ?)",
+        zip(df['Name'].astype(str), dates, times, confidence, ts.tolist())
+    )
+    print(f"Imported {len(df)} attendance records from {ATTENDANCE_FILE}")
+
+# Version of the attendance database schema, see get_attendance_db
+ATTENDANCE_SCHEMA_VERSION = 4
+
+def create_attendance_summary(conn, table, key):
+    """Create a table counting attendance records per key, kept current by triggers"""
+    # key is an SQL expression with {row} standing for the record's table or
+    # trigger row name, e.g. "{row}.date"
+    new_key, old_key, row_key = key.format(row="NEW"), key.format(row="OLD"), key.format(row="attendance")
+    conn.execute(f"CREATE TABLE {table} (key TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+    conn.execute(f"""CREATE TRIGGER {table}_insert AFTER INSERT ON attendance BEGIN
+        INSERT INTO {table} (key, count) VALUES ({new_key}, 1)
+            ON CONFLICT (key) DO UPDATE SET count = count + 1;
+    END""")
+    conn.execute(f"""CREATE TRIGGER {table}_delete AFTER DELETE ON attendance BEGIN
+        UPDATE {table} SET count = count - 1 WHERE key = {old_key};
+    END""")
+    conn.execute(f"INSERT INTO {table} (key, count) SELECT {row_key}, COUNT(*) FROM attendance GROUP BY 1")
+
+def get_attendance_db():
+    """Get the attendance database connection; hold attendance_lock while using it"""
+    global attendance_db
+    
+    if attendance_db is None:
+        os.makedirs(os.path.dirname(os.path.abspath(ATTENDANCE_DB)), exist_ok=True)
+        conn = sqlite3.connect(ATTENDANCE_DB, check_same_thread=False)
+        try:
+            init_attendance_db(conn)
+        except Exception:
+            conn.close()
+            raise
+        attendance_db = conn
+    return attendance_db
+
+def init_attendance_db(conn):
+    """Create or upgrade the attendance database schema"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode a commit appends to the log; NORMAL skips the fsync on
+    # every commit and syncs at checkpoints. The database stays consistent
+    # after a crash, and only a power loss can drop the latest marks.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS attendance (
+        name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        confidence REAL,
+        ts INTEGER NOT NULL
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_name_ts ON attendance (name, ts)")
+    
+    # user_version is the schema version: 1 once legacy records were
+    # imported, 2 once the per-hour summary exists, 3 with per-day counts
+    # and 4 with per-person counts
+    if conn.execute("PRAGMA user_version").fetchone()[0] < ATTENDANCE_SCHEMA_VERSION:
+        # Upgrade in one write transaction, re-reading the version inside
+        # it in case another worker process upgraded in the meantime
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                import_attendance_file(conn)
+            if version < 2:
+                # Records per hour of the day, for the peak hours statistic
+                create_attendance_summary(conn, "attendance_hours", "substr({row}.time, 1, 2)")
+            if version < 3:
+                # Records per date, for the today/week/month counts
+                create_attendance_summary(conn, "attendance_days", "{row}.date")
+            if version < 4:
+                # Records per person, for the totals and the most active person
+                create_attendance_summary(conn, "attendance_people", "{row}.name")
+            conn.execute(f"PRAGMA user_version = {ATTENDANCE_SCHEMA_VERSION}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    count = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+    print(f"Attendance database ready: {ATTENDANCE_DB} ({count} records)")
+
+def save_attendance(name, confidence, cooldown=0):
+    """Save attendance record, returning (saved, seconds since the person's last record)"""
+    # With a cooldown the check and the insert share one write transaction, so
+    # concurrent requests cannot both save, even across worker processes
     try:
         now = get_indian_time()
         date_str = now.strftime("%Y-%m-%d")
         time_str = now.strftime("%H:%M:%S")
         
-        # Check if file exists
-        if os.path.exists(ATTENDANCE_FILE):
-            df = pd.read_excel(ATTENDANCE_FILE)
-        else:
-            df = pd.DataFrame(columns=['Name', 'Date', 'Time'])
-        
-        # Create new record
-        new_record = {
-            'Name': name,
-            'Date': date_str,
-            'Time': time_str
-        }
-        
-        # Add record using pd.concat
-        new_df = pd.DataFrame([new_record])
-        df = pd.concat([df, new_df], ignore_index=True)
+        with attendance_lock:
+            conn = get_attendance_db()
+            # IMMEDIATE takes the database write lock before the check
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                last_ts = conn.execute(
+                    "SELECT MAX(ts) FROM attendance WHERE name = ?", (name,)
+                ).fetchone()[0]
+                elapsed = time.time() - last_ts if last_ts is not None else None
+                if elapsed is not None and 0 <= elapsed < cooldown:
+                    conn.rollback()
+                    return False, elapsed
+                
+                conn.execute(
+                    "INSERT INTO attendance (name, date, time, confidence, ts) VALUES (?, ?, ?, ?, ?)",
+                    (name, date_str, time_str, float(confidence), int(now.timestamp()))
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
         
-        # Save to Excel
-        df.to_excel(ATTENDANCE_FILE, index=False)
         print(f"Attendance saved: {name} at {date_str} {time_str}")
-        return True
+        return True, elapsed
         
     except Exception as e:
         print(f"Error saving attendance: {e}")
-        return False
+        return False, None
 
 # Routes
 @app.route('/health', methods=['GET'])
@@ -396,15 +1276,18 @@ def health_check():
 def debug_info():
     """Debug endpoint to check face data status"""
     try:
+        db = face_db
         return jsonify({
             "known_faces_dir": KNOWN_FACES_DIR,
             "dir_exists": os.path.exists(KNOWN_FACES_DIR),
-            "files_in_dir": os.listdir(KNOWN_FACES_DIR) if os.path.exists(KNOWN_FACES_DIR) else [],
-            "known_faces_count": len(known_faces),
-            "known_names": known_names,
-            "face_labels": face_labels,
+            "files_in_dir": list_known_face_files(),
+            "known_faces_count": len(db.faces),
+            "known_names": db.names,
+            "face_labels": db.labels,
             "attendance_file": ATTENDANCE_FILE,
-            "attendance_file_exists": os.path.exists(ATTENDANCE_FILE)
+            "attendance_file_exists": os.path.exists(ATTENDANCE_FILE),
+            "attendance_db": ATTENDANCE_DB,
+            "attendance_db_exists": os.path.exists(ATTENDANCE_DB)
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -445,9 +1328,8 @@ def serve_image(filename):
 def add_person():
     """Add a new person to the system"""
     try:
-        data = request.json
+        data, image_data = get_request_image_payload()
         name = data.get('name', '').strip()
-        image_data = data.get('image')
         
         print(f"Add person request received - Name: {name}")
         print(f"Known faces directory: {KNOWN_FACES_DIR}")
@@ -456,8 +1338,8 @@ def add_person():
         if not name or not image_data:
             return jsonify({"success": False, "message": "Name and image are required"}), 400
         
-        # Convert base64 to OpenCV image
-        image = base64_to_cv2(image_data)
+        # Convert base64 or uploaded bytes to OpenCV image
+        image = payload_to_cv2(image_data)
         if image is None:
             return jsonify({"success": False, "message": "Invalid image data"}), 400
         
@@ -465,46 +1347,48 @@ def add_person():
         
         # Detect faces in the image
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        # Use same detection parameters as training and recognition
-        faces = face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=1.1, 
-            minNeighbors=5, 
-            minSize=(30, 30),
-            maxSize=(300, 300)
-        )
+        # Use same detection parameters and resolution as training and recognition
+        faces = detect_faces_downscaled(image, gray, DETECTION_MAX_SIDE)
         
         print(f"Faces detected: {len(faces)}")
         
         if len(faces) == 0:
             return jsonify({"success": False, "message": "No face detected in the image"}), 400
         
-        # Upload image to ImageKit instead of saving locally
-        filename = f"{name}.jpg"
-        imagekit_url = upload_image_to_imagekit(image, filename)
+        # Preprocess the largest face now, while the grayscale frame and the
+        # detection are at hand, instead of re-detecting in the saved file
+        largest_face = max(faces, key=lambda face: face[2] * face[3])
+        face_region = preprocess_face(gray, largest_face)
         
-        if not imagekit_url or imagekit_url == "local_storage_fallback":
-            print("ImageKit upload failed or not available, continuing with local storage...")
-            imagekit_url = "Local storage only"
-        else:
-            print(f"Image uploaded to ImageKit: {imagekit_url}")
+        filename = f"{name}.jpg"
         
-        # Also save locally for face recognition training (always required)
+        # Save locally for face recognition training (always required)
         filepath = os.path.join(KNOWN_FACES_DIR, filename)
         print(f"Saving local copy for training: {filepath}")
         
         # Ensure directory exists
         os.makedirs(KNOWN_FACES_DIR, exist_ok=True)
         
-        success = cv2.imwrite(filepath, image)
-        print(f"Local save successful: {success}")
-        
-        if not success:
-            return jsonify({"success": False, "message": "Failed to save local training copy"}), 500
-        
-        # Reload faces to include the new person
-        load_success = load_known_faces()
-        print(f"Model retraining successful: {load_success}")
+        with face_db_lock:
+            success = cv2.imwrite(filepath, image)
+            print(f"Local save successful: {success}")
+            
+            if not success:
+                return jsonify({"success": False, "message": "Failed to save local training copy"}), 500
+            
+            # Process only the new image instead of reloading every known face
+            load_success = add_known_face(filename, face_region)
+            print(f"Model update successful: {load_success}")
+        
+        # Upload image to ImageKit in the background; /known-faces reports the
+        # URL once it is done
+        if imagekit:
+            imagekit_url = upload_status[filename] = "pending"
+            future = upload_executor.submit(upload_image_to_imagekit, image, filename)
+            future.add_done_callback(lambda done: finish_imagekit_upload(filename, done))
+        else:
+            print("ImageKit not configured, using local storage only")
+            imagekit_url = "Local storage only"
         
         return jsonify({
             "success": True,
@@ -522,13 +1406,14 @@ def add_person():
 def get_model_status():
     """Get the current status of the face recognition model"""
     try:
+        db = face_db
         return jsonify({
-            "is_trained": is_trained,
-            "known_faces_count": len(known_faces),
-            "known_names": list(set(known_names)),
-            "labels": face_labels,
+            "is_trained": db.is_trained,
+            "known_faces_count": len(db.faces),
+            "known_names": db.unique_names,
+            "labels": db.labels,
             "known_faces_dir": KNOWN_FACES_DIR,
-            "files_in_dir": os.listdir(KNOWN_FACES_DIR) if os.path.exists(KNOWN_FACES_DIR) else []
+            "files_in_dir": list_known_face_files()
         })
     except Exception as e:
         return jsonify({"error": f"Error getting model status: {str(e)}"}), 500
@@ -537,72 +1422,138 @@ def get_model_status():
 def debug_model():
     """Debug endpoint to check model status"""
     try:
+        db = face_db
         return jsonify({
-            "is_trained": is_trained,
-            "num_known_faces": len(known_faces),
-            "known_names": known_names,
-            "face_labels": face_labels,
+            "is_trained": db.is_trained,
+            "num_known_faces": len(db.faces),
+            "known_names": db.names,
+            "face_labels": db.labels,
             "known_faces_dir": KNOWN_FACES_DIR,
-            "files_in_dir": os.listdir(KNOWN_FACES_DIR) if os.path.exists(KNOWN_FACES_DIR) else []
+            "files_in_dir": list_known_face_files()
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def run_retrain():
+    """Reload every known face; the new database is swapped in when complete"""
+    with face_db_lock:
+        success = load_known_faces()
+        db = face_db
+    return success, len(db.faces), list(db.names)
+
+def retrain_status(job_id, future):
+    """Describe a retrain job for the retrain endpoints"""
+    if not future.done():
+        return {"success": True, "status": "running", "job_id": job_id, "message": "Retraining in progress"}
+    
+    try:
+        success, count, names = future.result()
+    except Exception as e:
+        return {"success": False, "status": "failed", "job_id": job_id, "message": f"Error retraining model: {str(e)}"}
+    
+    if success:
+        return {
+            "success": True,
+            "status": "done",
+            "job_id": job_id,
+            "message": f"Model retrained successfully with {count} faces",
+            "known_names": names
+        }
+    return {"success": False, "status": "done", "job_id": job_id, "message": "No faces found for training"}
+
+def publish_retrain_status(status):
+    """Write a retrain job's status where the other worker processes can read it"""
+    try:
+        os.makedirs(FACE_CACHE_DIR, exist_ok=True)
+        suffix = f'.{os.getpid()}.tmp'
+        with open(RETRAIN_STATUS_FILE + suffix, 'w') as f:
+            json.dump(status, f)
+        os.replace(RETRAIN_STATUS_FILE + suffix, RETRAIN_STATUS_FILE)
+    except Exception as e:
+        print(f"Error saving retrain status: {e}")
+
+def read_retrain_status():
+    """Get the latest retrain status published by any worker process, or None"""
+    try:
+        with open(RETRAIN_STATUS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
 @app.route('/api/retrain-model', methods=['POST'])
 def retrain_model():
-    """Manually retrain the face recognition model"""
+    """Start retraining the face recognition model in the background"""
+    global retrain_job
+    
     try:
-        success = load_known_faces()
-        if success:
-            return jsonify({
-                "success": True,
-                "message": f"Model retrained successfully with {len(known_faces)} faces",
-                "known_names": known_names
-            })
-        else:
-            return jsonify({
-                "success": False,
-                "message": "No faces found for training"
-            }), 400
+        with retrain_job_lock:
+            job_id, future = retrain_job
+            if future is None or future.done():
+                # Millisecond job ids stay unique across worker processes
+                job_id = time.time_ns() // 1_000_000
+                publish_retrain_status(retrain_status(job_id, Future()))
+                future = retrain_executor.submit(run_retrain)
+                future.add_done_callback(lambda done, job_id=job_id: publish_retrain_status(retrain_status(job_id, done)))
+                retrain_job = (job_id, future)
+        
+        return jsonify(retrain_status(job_id, future)), 202
     except Exception as e:
         return jsonify({"success": False, "message": f"Error retraining model: {str(e)}"}), 500
 
+@app.route('/api/retrain-status', methods=['GET'])
+def get_retrain_status():
+    """Get the status of the latest retrain job"""
+    job_id, future = retrain_job
+    requested = request.args.get('job_id', type=int)
+    if future is not None and requested in (None, job_id):
+        return jsonify(retrain_status(job_id, future))
+    
+    # The job may have been started by another worker process
+    status = read_retrain_status()
+    if status is None or (requested is not None and status.get('job_id') != requested):
+        return jsonify({"success": False, "message": "Retrain job not found"}), 404
+    return jsonify(status)
+
 @app.route('/mark-attendance', methods=['POST'])
 @app.route('/api/mark-attendance', methods=['POST'])
+@app.route('/mark-attendance-raw', methods=['POST'])
+@app.route('/api/mark-attendance-raw', methods=['POST'])
 def mark_attendance():
     """Mark attendance from webcam image"""
     try:
         print("=== Mark Attendance Request ===")
-        data = request.json
-        image_data = data.get('image')
+        _, image_data = get_request_image_payload()
         
         if not image_data:
             print("Error: No image data provided")
             return jsonify({"success": False, "message": "Image data is required"}), 400
         
-        if not is_trained:
+        # Match against one version of the database, so a concurrent update
+        # cannot mix faces and names from different versions
+        db = face_db
+        if not db.is_trained:
             print("Error: No faces trained")
             return jsonify({"success": False, "message": "No known faces available for recognition"}), 400
         
         print(f"Processing image data (length: {len(image_data) if image_data else 0})")
-        print(f"Known faces: {len(known_faces)}, Names: {known_names}")
-        
-        # Convert base64 to OpenCV image
-        image = base64_to_cv2(image_data)
+        print(f"Known faces: {len(db.faces)}")
+        
+        # Convert base64 or uploaded bytes to OpenCV image. Large frames are
+        # reduced while decoding since the face region is resized to FACE_SIZE anyway.
+        # The Haar cascade only looks at the grayscale image, so without YuNet
+        # the frame is decoded straight to grayscale.
+        color_needed = face_detector is not None
+        image = payload_to_cv2(image_data, max_side=RECOGNITION_MAX_SIDE, grayscale=not color_needed)
         if image is None:
             print("Error: Failed to decode image")
             return jsonify({"success": False, "message": "Invalid image data"}), 400
         
         # Convert to grayscale and detect faces
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        # Improved face detection parameters
-        faces = face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=1.1, 
-            minNeighbors=5, 
-            minSize=(30, 30),
-            maxSize=(300, 300)
-        )
+        if color_needed:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=get_scratch('gray', image.shape[:2]))
+        else:
+            gray, image = image, None
+        faces = detect_faces_downscaled(image, gray, DETECTION_MAX_SIDE)
         
         if len(faces) == 0:
             return jsonify({
@@ -613,62 +1564,58 @@ def mark_attendance():
         
         # Process the largest face (most likely the main subject)
         largest_face = max(faces, key=lambda face: face[2] * face[3])
-        x, y, w, h = largest_face
-        
-        # Add some padding around the face
-        padding = 10
-        x = max(0, x - padding)
-        y = max(0, y - padding)
-        w = min(gray.shape[1] - x, w + 2 * padding)
-        h = min(gray.shape[0] - y, h + 2 * padding)
-        
-        face_region = gray[y:y+h, x:x+w]
-        face_region = cv2.resize(face_region, (150, 150))
-        # Apply histogram equalization for consistency with training
-        face_region = cv2.equalizeHist(face_region)
-        # Apply Gaussian blur to reduce noise
-        face_region = cv2.GaussianBlur(face_region, (3, 3), 0)
+        # Same preprocessing as the known faces for consistent comparison
+        face_region = preprocess_face(gray, largest_face, out=get_scratch('face', (FACE_SIZE, FACE_SIZE)))
         
         # Find best match using our custom face recognition
-        match_idx, confidence_score = find_best_match(face_region)
+        match_idx, confidence_score = find_best_match(face_region, db)
         
         print(f"Recognition result - Match Index: {match_idx}, Confidence: {confidence_score}")
-        print(f"Available faces: {len(known_faces)}")
-        print(f"Available names: {known_names}")
         
         # Recognition threshold
         CONFIDENCE_THRESHOLD = 0.6  # Similarity score threshold
         
-        if match_idx is not None and confidence_score >= CONFIDENCE_THRESHOLD:
-            recognized_name = known_names[match_idx]
+        # Labels are dense positions in the database, so the name is a direct index
+        if match_idx is not None and 0 <= match_idx < len(db.names) and confidence_score >= CONFIDENCE_THRESHOLD:
+            recognized_name = db.names[match_idx]
             print(f"Person recognized: {recognized_name} with confidence: {confidence_score}")
             
-            # Check cooldown period (1 minute)
-            current_time = get_indian_time()
-            last_time = last_attendance.get(recognized_name)
-            
-            if last_time and (current_time - last_time).total_seconds() < 60:
-                remaining_seconds = 60 - int((current_time - last_time).total_seconds())
-                return jsonify({
-                    "success": False,
-                    "message": f"Attendance already marked. Please wait {remaining_seconds} seconds.",
-                    "cooldown": True,
-                    "remaining_seconds": remaining_seconds,
-                    "audio": "attendance_is_already_marked"
-                })
-            
-            # Save attendance
-            if save_attendance(recognized_name, confidence_score):
-                last_attendance[recognized_name] = current_time
-                return jsonify({
-                    "success": True,
-                    "name": recognized_name,
-                    "confidence": confidence_score,
-                    "message": f"Attendance marked for {recognized_name}",
-                    "audio": "attendance_marked"
-                })
+            # Check cooldown period (1 minute). Marks made by this process are
+            # answered from memory; otherwise the database decides, since the
+            # person may have been marked by another worker process.
+            now = time.monotonic()
+            with last_attendance_lock:
+                last_time = last_attendance.get(recognized_name)
+            # Entries taken from the database can outlive their cooldown in
+            # the cache, since the TTL runs from when they were added
+            if last_time is not None and now - last_time < ATTENDANCE_COOLDOWN:
+                elapsed = now - last_time
             else:
-                return jsonify({"success": False, "message": "Failed to save attendance"}), 500
+                # Save attendance unless the database has a mark in the cooldown
+                saved, elapsed = save_attendance(recognized_name, confidence_score, ATTENDANCE_COOLDOWN)
+                if saved:
+                    with last_attendance_lock:
+                        last_attendance[recognized_name] = now
+                    return jsonify({
+                        "success": True,
+                        "name": recognized_name,
+                        "confidence": confidence_score,
+                        "message": f"Attendance marked for {recognized_name}",
+                        "audio": "attendance_marked"
+                    })
+                if elapsed is None:
+                    return jsonify({"success": False, "message": "Failed to save attendance"}), 500
+                with last_attendance_lock:
+                    last_attendance[recognized_name] = now - elapsed
+            
+            remaining_seconds = ATTENDANCE_COOLDOWN - int(elapsed)
+            return jsonify({
+                "success": False,
+                "message": f"Attendance already marked. Please wait {remaining_seconds} seconds.",
+                "cooldown": True,
+                "remaining_seconds": remaining_seconds,
+                "audio": "attendance_is_already_marked"
+            })
         else:
             print(f"Face not recognized - Confidence: {confidence_score}, Threshold: {CONFIDENCE_THRESHOLD}")
             return jsonify({
@@ -694,32 +1641,21 @@ def mark_attendance():
 def get_attendance_records():
     """Get attendance records"""
     try:
-        if not os.path.exists(ATTENDANCE_FILE):
-            return jsonify({"records": [], "count": 0})
-        
-        df = pd.read_excel(ATTENDANCE_FILE)
-        records = df.to_dict('records')
-        
-        # Convert datetime objects to strings and normalize field names
-        normalized_records = []
-        for record in records:
-            normalized_record = {}
-            for key, value in record.items():
-                # Normalize key names to lowercase
-                normalized_key = key.lower()
-                
-                if pd.isna(value):
-                    normalized_record[normalized_key] = None
-                elif isinstance(value, (pd.Timestamp, datetime)):
-                    normalized_record[normalized_key] = value.strftime("%Y-%m-%d") if 'date' in normalized_key else value.strftime("%H:%M:%S")
-                else:
-                    normalized_record[normalized_key] = str(value)
-            
-            # Add confidence if not present
-            if 'confidence' not in normalized_record:
-                normalized_record['confidence'] = 0.9  # Default confidence
-                
-            normalized_records.append(normalized_record)
+        with attendance_lock:
+            rows = get_attendance_db().execute(
+                "SELECT name, date, time, confidence FROM attendance ORDER BY rowid"
+            ).fetchall()
+        
+        # Records imported from the Excel file have no confidence
+        normalized_records = [
+            {
+                "name": name,
+                "date": date,
+                "time": time_str,
+                "confidence": confidence if confidence is not None else 0.9  # Default confidence
+            }
+            for name, date, time_str, confidence in rows
+        ]
         
         return jsonify({"records": normalized_records, "count": len(normalized_records)})
         
@@ -730,12 +1666,39 @@ def get_attendance_records():
 def download_attendance():
     """Download attendance records as Excel file"""
     try:
-        if not os.path.exists(ATTENDANCE_FILE):
+        # Stream the records into the workbook row by row. In constant memory
+        # mode rows are flushed to disk as they are written, so neither the
+        # records nor the sheet are held in memory.
+        buffer = tempfile.TemporaryFile()
+        workbook = xlsxwriter.Workbook(buffer, {'constant_memory': True})
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, ("Name", "Date", "Time"))
+        
+        # Make sure the database exists before reading it
+        with attendance_lock:
+            get_attendance_db()
+        
+        # Read on a separate connection, like the backup, so attendance can
+        # still be marked while the workbook is written. In WAL mode the
+        # SELECT sees one consistent snapshot.
+        count = 0
+        read_conn = sqlite3.connect(ATTENDANCE_DB)
+        try:
+            rows = read_conn.execute("SELECT name, date, time FROM attendance ORDER BY rowid")
+            for count, row in enumerate(rows, start=1):
+                worksheet.write_row(count, 0, row)
+        finally:
+            read_conn.close()
+        workbook.close()
+        
+        if count == 0:
+            buffer.close()
             return jsonify({"success": False, "message": "No attendance records found"}), 404
+        buffer.seek(0)
         
         # Send the Excel file
         return send_file(
-            ATTENDANCE_FILE,
+            buffer,
             as_attachment=True,
             download_name=f"attendance_records_{get_indian_time().strftime('%Y%m%d_%H%M%S')}.xlsx",
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
@@ -748,17 +1711,16 @@ def download_attendance():
 def get_known_faces_list():
     """Get list of known faces"""
     try:
-        people = []
-        if os.path.exists(KNOWN_FACES_DIR):
-            for filename in os.listdir(KNOWN_FACES_DIR):
-                if filename.endswith('.jpg') or filename.endswith('.png'):
-                    filepath = os.path.join(KNOWN_FACES_DIR, filename)
-                    stat = os.stat(filepath)
-                    people.append({
-                        "name": filename.split('.')[0],
-                        "image_path": filename,
-                        "date_added": datetime.fromtimestamp(stat.st_ctime).isoformat()
-                    })
+        with known_index_lock:
+            people = [
+                {
+                    "name": name,
+                    "image_path": filename,
+                    "date_added": datetime.fromtimestamp(ctime).isoformat(),
+                    "imagekit_url": upload_status.get(filename)
+                }
+                for filename, (name, ctime) in known_index.items()
+            ]
         
         return jsonify({"people": people, "count": len(people)})
         
@@ -775,20 +1737,25 @@ def delete_person():
         if not name:
             return jsonify({"success": False, "message": "Name is required"}), 400
         
-        # Find and delete the image file
-        deleted = False
-        for filename in os.listdir(KNOWN_FACES_DIR):
-            if filename.startswith(name + '.') and (filename.endswith('.jpg') or filename.endswith('.png')):
-                filepath = os.path.join(KNOWN_FACES_DIR, filename)
-                os.remove(filepath)
-                deleted = True
-                break
-        
-        if not deleted:
-            return jsonify({"success": False, "message": f"Person '{name}' not found"}), 404
-        
-        # Reload faces
-        load_known_faces()
+        with face_db_lock:
+            # Find and delete the image file
+            with known_index_lock:
+                deleted = name_to_file.get(name)
+            
+            try:
+                if deleted:
+                    os.remove(os.path.join(KNOWN_FACES_DIR, deleted))
+            except FileNotFoundError:
+                # Already removed outside the API; drop the stale entry below
+                remove_known_face(deleted)
+                deleted = None
+            
+            if not deleted:
+                return jsonify({"success": False, "message": f"Person '{name}' not found"}), 404
+            
+            # Drop only the deleted person instead of reloading every known face
+            remove_known_face(deleted)
+            upload_status.pop(deleted, None)
         
         return jsonify({
             "success": True,
@@ -798,59 +1765,97 @@ def delete_person():
     except Exception as e:
         return jsonify({"success": False, "message": f"Error deleting person: {str(e)}"}), 500
 
+# Last computed statistics as (last rowid, date, result), reused while no
+# record has been added and the date is unchanged. Replaced as a whole so
+# concurrent requests never see a result paired with the wrong key.
+stats_cache = (None, None, None)
+
+# Statistics for an empty attendance table
+EMPTY_STATS = {
+    "total_records": 0,
+    "unique_people": 0,
+    "today_attendance": 0,
+    "this_week": 0,
+    "this_month": 0,
+    "average_confidence": 0,
+    "most_active_person": None,
+    "peak_hours": []
+}
+
+def compute_statistics(conn, today):
+    """Compute attendance statistics from the attendance summary tables"""
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    
+    # The total, the number of people and the most active one from the
+    # per-person counts kept up to date on insert
+    total_records, unique_people = conn.execute(
+        "SELECT COALESCE(SUM(count), 0), COUNT(*) FROM attendance_people WHERE count > 0"
+    ).fetchone()
+    row = conn.execute(
+        "SELECT key FROM attendance_people WHERE count > 0 ORDER BY count DESC, key LIMIT 1"
+    ).fetchone()
+    most_active_person = row[0] if row else None
+    
+    # Today, this week and this month from the per-date counts kept up to
+    # date on insert, which is at most a few weeks of rows
+    today_attendance, this_week, this_month = conn.execute(
+        """SELECT SUM(count * (key = ?)), SUM(count * (key >= ?)), SUM(count * (key >= ?))
+           FROM attendance_days WHERE key >= ?""",
+        (today.isoformat(), week_start.isoformat(), month_start.isoformat(),
+         min(week_start, month_start).isoformat())
+    ).fetchone()
+    
+    # Peak hours analysis from the per-hour counts kept up to date on insert
+    peak_hours = [
+        {"hour": int(hour), "count": count}
+        for hour, count in conn.execute(
+            "SELECT key, count FROM attendance_hours WHERE count > 0 ORDER BY count DESC, key LIMIT 3"
+        )
+    ]
+    
+    return {
+        "total_records": total_records,
+        "unique_people": unique_people,
+        "today_attendance": today_attendance or 0,
+        "this_week": this_week or 0,
+        "this_month": this_month or 0,
+        "average_confidence": 0.85,  # Default confidence
+        "most_active_person": most_active_person,
+        "peak_hours": peak_hours
+    }
+
 @app.route('/api/statistics', methods=['GET'])
 def get_statistics():
     """Get attendance statistics"""
+    global stats_cache
+    
     try:
-        if not os.path.exists(ATTENDANCE_FILE):
-            return jsonify({
-                "total_records": 0,
-                "unique_people": 0,
-                "today_attendance": 0,
-                "this_week": 0,
-                "this_month": 0,
-                "average_confidence": 0,
-                "most_active_person": None,
-                "peak_hours": []
-            })
-        
-        df = pd.read_excel(ATTENDANCE_FILE)
         today = get_indian_time().date()
-        week_start = today - timedelta(days=today.weekday())
-        month_start = today.replace(day=1)
-        
-        # Convert Date column to datetime for filtering
-        df['Date'] = pd.to_datetime(df['Date']).dt.date
-        
-        # Basic statistics
-        total_records = len(df)
-        unique_people = df['Name'].nunique()
-        today_attendance = len(df[df['Date'] == today])
-        this_week = len(df[df['Date'] >= week_start])
-        this_month = len(df[df['Date'] >= month_start])
-        
-        # Most active person
-        person_counts = df['Name'].value_counts()
-        most_active_person = person_counts.index[0] if len(person_counts) > 0 else None
-        
-        # Peak hours analysis
-        if 'Time' in df.columns:
-            df['Hour'] = pd.to_datetime(df['Time'], format='%H:%M:%S').dt.hour
-            hour_counts = df['Hour'].value_counts().head(3)
-            peak_hours = [{"hour": int(hour), "count": int(count)} for hour, count in hour_counts.items()]
-        else:
-            peak_hours = []
         
-        return jsonify({
-            "total_records": total_records,
-            "unique_people": unique_people,
-            "today_attendance": today_attendance,
-            "this_week": this_week,
-            "this_month": this_month,
-            "average_confidence": 0.85,  # Default confidence
-            "most_active_person": most_active_person,
-            "peak_hours": peak_hours
-        })
+        with attendance_lock:
+            conn = get_attendance_db()
+            
+            # Records are only ever appended, so an unchanged last rowid on
+            # the same day means the previous result is still valid
+            last_rowid = conn.execute("SELECT MAX(rowid) FROM attendance").fetchone()[0]
+            etag = f"{last_rowid or 0}-{today.toordinal()}"
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            elif last_rowid is None:
+                response = jsonify(EMPTY_STATS)
+            else:
+                cached_rowid, cached_today, result = stats_cache
+                if cached_rowid != last_rowid or cached_today != today:
+                    result = compute_statistics(conn, today)
+                    stats_cache = (last_rowid, today, result)
+                response = jsonify(result)
+        
+        # Clients may reuse the response, but must revalidate it first since a
+        # new mark changes it at any time
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
         
     except Exception as e:
         return jsonify({"success": False, "message": f"Error getting statistics: {str(e)}"}), 500
@@ -859,48 +1864,60 @@ def get_statistics():
 def backup_data():
     """Create a backup of attendance data"""
     try:
-        backup_dir = os.path.join(os.path.dirname(ATTENDANCE_FILE), 'backups')
+        backup_dir = os.path.join(os.path.dirname(ATTENDANCE_DB), 'backups')
         os.makedirs(backup_dir, exist_ok=True)
         
         timestamp = get_indian_time().strftime('%Y%m%d_%H%M%S')
-        backup_file = os.path.join(backup_dir, f'attendance_backup_{timestamp}.xlsx')
+        backup_file = os.path.join(backup_dir, f'attendance_backup_{timestamp}.db')
+        
+        # Make sure the database exists before reading it
+        with attendance_lock:
+            get_attendance_db()
+        
+        # VACUUM INTO writes a consistent, compacted copy (including changes
+        # still in the write-ahead log) from a single read transaction. It
+        # runs on its own connection so attendance can still be marked while
+        # the copy is written. A hardlink would not do: the live file keeps
+        # changing in place.
+        # VACUUM INTO refuses to overwrite, e.g. a backup from the same second
+        if os.path.exists(backup_file):
+            os.remove(backup_file)
+        backup_conn = sqlite3.connect(ATTENDANCE_DB)
+        try:
+            backup_conn.execute("VACUUM INTO ?", (backup_file,))
+        finally:
+            backup_conn.close()
         
-        if os.path.exists(ATTENDANCE_FILE):
-            import shutil
-            shutil.copy2(ATTENDANCE_FILE, backup_file)
-            
-            return jsonify({
-                "success": True,
-                "message": "Backup created successfully",
-                "backup_file": backup_file,
-                "timestamp": timestamp
-            })
-        else:
-            return jsonify({"success": False, "message": "No attendance file to backup"}), 404
+        return jsonify({
+            "success": True,
+            "message": "Backup created successfully",
+            "backup_file": backup_file,
+            "timestamp": timestamp
+        })
             
     except Exception as e:
         return jsonify({"success": False, "message": f"Error creating backup: {str(e)}"}), 500
 
+# Development server. Production runs wsgi:app under gunicorn (see wsgi.py).
 if __name__ == '__main__':
     print("Face Recognition API starting...")
     print(f"Known faces directory: {KNOWN_FACES_DIR}")
     print(f"Directory exists: {os.path.exists(KNOWN_FACES_DIR)}")
-    print(f"Attendance file: {ATTENDANCE_FILE}")
+    print(f"Attendance database: {ATTENDANCE_DB}")
     print(f"Starting server on port {PORT}")
     
-    # Debug: List files in known faces directory
-    if os.path.exists(KNOWN_FACES_DIR):
-        files = os.listdir(KNOWN_FACES_DIR)
-        print(f"Files in known_faces directory: {files}")
-    else:
+    if not os.path.exists(KNOWN_FACES_DIR):
         print("Known faces directory does not exist!")
     
     # Load known faces on startup
     load_known_faces()
+    start_known_faces_watcher()
     
-    # Print loaded face data
-    print(f"Loaded faces: {len(known_faces)} faces")
-    print(f"Known names: {known_names}")
+    # Print loaded face data. The file list comes from the index built by the
+    # load's scandir pass rather than a second directory listing.
+    print(f"Files in known_faces directory: {list_known_face_files()}")
+    print(f"Loaded faces: {len(face_db.faces)} faces")
+    print(f"Known names: {list(face_db.names)}")
     
     # Run the Flask app
     app.run(host='0.0.0.0', port=PORT, debug=False)
@@ -0,0 +1,32 @@
+#!/bin/sh
+
+# Download the YuNet face detector model from a pinned opencv_zoo commit and
+# verify it. Set YUNET_COMMIT to the commit and YUNET_SHA256 to the model's
+# checksum (see DEPLOYMENT.md). Without them the Haar cascade is used.
+
+YUNET_MODEL="models/face_detection_yunet_2023mar.onnx"
+
+if [ -f "$YUNET_MODEL" ]; then
+    exit 0
+fi
+
+if [ -z "$YUNET_COMMIT" ] || [ -z "$YUNET_SHA256" ]; then
+    echo "YUNET_COMMIT and YUNET_SHA256 not set, the Haar cascade will be used."
+    exit 0
+fi
+
+echo "Downloading YuNet face detector model..."
+mkdir -p models
+URL="https://github.com/opencv/opencv_zoo/raw/$YUNET_COMMIT/models/face_detection_yunet/face_detection_yunet_2023mar.onnx"
+if command -v curl > /dev/null; then
+    curl -fsSL -o "$YUNET_MODEL.tmp" "$URL"
+else
+    python3 -c "import sys, urllib.request; urllib.request.urlretrieve(*sys.argv[1:])" "$URL" "$YUNET_MODEL.tmp"
+fi || { rm -f "$YUNET_MODEL.tmp"; echo "YuNet model download failed."; exit 1; }
+
+if ! echo "$YUNET_SHA256  $YUNET_MODEL.tmp" | sha256sum -c -; then
+    rm -f "$YUNET_MODEL.tmp"
+    echo "YuNet model checksum mismatch."
+    exit 1
+fi
+mv "$YUNET_MODEL.tmp" "$YUNET_MODEL"
@@ -0,0 +1,21 @@
+"""gunicorn settings for the Face Attendance API, read from the backend directory"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5002')}"
+
+# Worker processes, each with its own copy of the face database (about 180 MB).
+# One by default so small instances (512 MB on Render's free plan) do not run
+# out of memory; raise WEB_CONCURRENCY where there are more cores and memory.
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Threads share their worker's face database; OpenCV and NumPy release the GIL
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Retraining and the first request after a cold start can take a while
+timeout = 120
+
+# Not preloaded: each worker must load the faces, start its directory watcher
+# thread and open its database connection after forking (see wsgi.py)
+preload_app = False
@@ -25,6 +25,10 @@ if [ ! -f ".env" ]; then
     echo "Please edit .env file with your configuration before running the server."
 fi
 
+# Download the YuNet face detector model when YUNET_COMMIT and YUNET_SHA256 are
+# set (falls back to the Haar cascade without it)
+sh fetch_yunet_model.sh || echo "The Haar cascade will be used."
+
 # Check if known_faces directory exists
 KNOWN_FACES_DIR="../projects/known_faces"
 if [ ! -d "$KNOWN_FACES_DIR" ]; then
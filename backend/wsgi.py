@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""WSGI entry point: run `gunicorn wsgi:app` from the backend directory"""
+
+# Each worker process loads its own face database and watches KNOWN_FACES_DIR,
+# so changes made through one worker reach the others through the filesystem.
+# Do not use --preload: the watcher thread and the database connection must be
+# created after forking.
+
+from app import app, load_known_faces, start_known_faces_watcher
+
+# gunicorn loads wsgi:app
+__all__ = ['app']
+
+# Same startup as running app.py directly
+load_known_faces()
+start_known_faces_watcher()
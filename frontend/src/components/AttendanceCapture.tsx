@@ -120,15 +120,19 @@ function AttendanceCapture() {
       setIsLoading(true);
       setError(null);
       
-      const imageSrc = webcamRef.current.getScreenshot();
-      if (!imageSrc) {
+      // Send the frame as raw JPEG bytes rather than a base64 data URL
+      const canvas = webcamRef.current.getCanvas();
+      const imageBlob = canvas
+        ? await new Promise<Blob | null>((resolve) => canvas.toBlob(resolve, 'image/jpeg', 0.92))
+        : null;
+      if (!imageBlob) {
         throw new Error('Failed to capture image');
       }
 
       const response = await axios.post<AttendanceResponse>(
-        `${API_BASE_URL}/api/mark-attendance`,
-        { image: imageSrc },
-        { timeout: 10000 }
+        `${API_BASE_URL}/api/mark-attendance-raw`,
+        imageBlob,
+        { headers: { 'Content-Type': 'image/jpeg' }, timeout: 10000 }
       );
 
       setLastResult(response.data);
@@ -227,7 +227,14 @@ function Settings() {
   const retrainModel = async () => {
     try {
       setRetrainStatus('training');
-      const response = await axios.post(`${API_BASE_URL}/api/retrain-model`);
+      // Retraining runs in the background; poll until the job finishes
+      let response = await axios.post(`${API_BASE_URL}/api/retrain-model`);
+      while (response.data.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        response = await axios.get(`${API_BASE_URL}/api/retrain-status`, {
+          params: { job_id: response.data.job_id }
+        });
+      }
       
       if (response.data.success) {
         setRetrainStatus('success');